@@ -1,15 +1,41 @@
+import ctypes
+import math
+import operator
+import re
+import weakref
+from collections import OrderedDict
+from functools import reduce
+
 import numpy as np
 from dask import delayed
+from dask.threaded import get as threaded_get
+from llvmlite import binding as llvm, ir
+from numba import float64, njit, vectorize
+
+neg = operator.neg  # setting negative function
 
-neg = float.__neg__  # setting negative function
+llvm.initialize_native_target()
+llvm.initialize_native_asmprinter()
+_target = llvm.Target.from_default_triple()
+_double = ir.DoubleType()
 
 
-def _product(*inputs):
-    return np.product(inputs)
+def _product(*inputs):  # Unrolled for small operand counts; the operators broadcast over arrays of values
+    if len(inputs) == 2:
+        return inputs[0]*inputs[1]
+    elif len(inputs) == 3:
+        return inputs[0]*inputs[1]*inputs[2]
+    else:
+        return math.prod(inputs)
 
 
 def _sum(*inputs):
-    return sum(inputs)
+    if len(inputs) == 2:
+        return inputs[0] + inputs[1]
+    elif len(inputs) == 3:
+        return inputs[0] + inputs[1] + inputs[2]
+    else:
+        return sum(inputs)
 
 
 def _divide(one, two):
@@ -25,40 +51,255 @@ def _turn_into_bracket(latex):  # Putting brackets around a latex string
     return '{' + bracket + '}'
 
 
+def _dispatch(handlers, obj):  # Getting the handler for the type of an object, resolving subclasses only once
+    handler = handlers.get(type(obj))
+    if handler is None:
+        handler = handlers[type(obj)] = next(h for t, h in handlers.items() if isinstance(obj, t))
+    return handler(obj)
+
+
 def _check_inv(child, type):  # Checking that an object is an additive inverse
     if type == 'neg':
-        if isinstance(child, (int, float)):
-            return child < 0
-        elif isinstance(child, Variable):
-            return False
-        else:
-            return child.inverted == type
+        return _dispatch(_NEG_CHECKS, child)
 
 
 def _get_latex_repr(obj):  # Getting the latex representation of an object
+    return _dispatch(_LATEX_HANDLERS, obj)
+
+
+def _get_source(obj, names, lines=None):  # Getting the python source representation of an object
     if isinstance(obj, (int, float)):
-        return '{' + str(obj) + '}'
+        value = float(obj)  # Raises OverflowError for ints outside the range of a double
+        if math.isnan(value):
+            return 'np.nan'
+        elif math.isinf(value):
+            return 'np.inf' if value > 0 else '(-np.inf)'
+        return repr(value)
     elif isinstance(obj, Variable):
-        return '{' + obj.name + '}'
+        return names[id(obj)]
     else:
-        return obj.latex_str
+        return obj.to_source(names, lines)
 
 
-def _get_task(obj):  # Getting the task representation of an object
-    if isinstance(obj, (int, float, str)):
+def _get_lambda_source(operation):  # Python source of a function of the operation's variables, named by position
+    variables = operation.node.get_variables()
+    names = {id(variable): f'_v{i}' for i, variable in enumerate(variables)}
+    params = ', '.join(names.values())
+    lines = []
+    result = operation.to_source(names, lines)
+    body = ''.join(f'    {line}\n' for line in lines)
+    return f"def f({params}):\n{body}    return {result}"
+
+
+def _lambdify(src):  # Turning generated source into a python function
+    namespace = {'np': np}
+    exec(src, namespace)
+    return namespace['f']
+
+
+_float_match = re.compile(r'-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$|-?inf$|nan$').match  # Matching str() of a number
+
+_INT_POWER_LIMIT = 16  # Integer powers up to this size are lowered to multiplications
+
+_COMPILED_CACHE_SIZE = 256
+
+# Recently compiled functions by generated source or IR, which name no Variable, so rebuilt expressions reuse them
+_compiled_cache = OrderedDict()
+
+
+def _get_compiled(key, build):  # Getting a function from the bounded compiled cache, building it if missing
+    if key in _compiled_cache:
+        _compiled_cache.move_to_end(key)
+    else:
+        _compiled_cache[key] = build()
+        if len(_compiled_cache) > _COMPILED_CACHE_SIZE:
+            _compiled_cache.popitem(last=False)
+    return _compiled_cache[key]
+
+
+def _jit_llvm(ir_text, n_args):  # JIT-compiling a module with an `expr` function of n_args doubles
+    # The engine takes ownership of its target machine, so each one gets its own
+    target_machine = _target.create_target_machine()
+    engine = llvm.create_mcjit_compiler(llvm.parse_assembly(ir_text), target_machine)
+    engine.finalize_object()
+    c_function_type = ctypes.CFUNCTYPE(ctypes.c_double, *[ctypes.c_double]*n_args)
+    function = c_function_type(engine.get_function_address('expr'))
+    function.engine = engine  # The machine code lives as long as the engine, so the function keeps it
+    return function
+
+_DIRECT_EVAL_LIMIT = 32  # Trees with fewer operations than this are evaluated without Dask
+
+_LITERAL_CACHE = {value: ('lit', float(value)) for value in [*range(-16, 17), 0.5]}  # Keys of common constants
+
+
+def _lit(value):  # Getting the shared key of a common constant, so that e.g. 1 and 1.0 match
+    if value == 0 and math.copysign(1.0, value) < 0:  # -0.0 equals 0 but must not share its node
+        return None
+    return _LITERAL_CACHE.get(value)
+
+
+def _get_node_key(obj):  # Getting the identity of an object for node interning
+    if isinstance(obj, Operation):
+        return id(obj.node)
+    elif isinstance(obj, (Variable, DelayedTaskNode)):
+        return id(obj)
+    elif isinstance(obj, float):  # Keeping the sign, as 0.0 and -0.0 compare equal
+        return _lit(obj) or ('lit', type(obj), obj, math.copysign(1.0, obj))
+    else:
+        return _lit(obj) or ('lit', type(obj), obj)
+
+
+def _get_static_arg(obj):  # Getting the part of a task's arguments that is fixed at construction
+    if isinstance(obj, Operation):
+        return obj.node
+    else:
         return obj
-    elif isinstance(obj, Operation):
-        return obj.node.create_task()
-    elif isinstance(obj, Variable):
-        return delayed(getattr)(obj, 'value')
+
+
+def _no_task(obj):  # Fallback for objects that cannot appear in a task graph
+    raise TypeError(f'Cannot build a task from {type(obj).__name__!r} object')
+
+
+def _get_task(obj):  # Getting the task representation of an object
+    return _dispatch(_TASK_HANDLERS, obj)
+
+
+def _reduce_balanced(combine, values):  # Combining values pairwise so the dependency chain is log2(k) deep
+    while len(values) > 1:
+        paired = [combine(one, two) for one, two in zip(values[::2], values[1::2])]
+        if len(values) % 2:
+            paired.append(values[-1])
+        values = paired
+    return values[0]
+
+
+def _emit_sum(builder, values, factors):  # Terms that are products are fused into the sum with fma
+    products = [value for value in values if id(value) in factors]
+    terms = [value for value in values if id(value) not in factors] or [products.pop()]
+    result = _reduce_balanced(builder.fadd, terms)
+    for product in products:
+        head = _reduce_balanced(builder.fmul, factors[id(product)][:-1])
+        result = builder.fma(head, factors[id(product)][-1], result)
+    return result
+
+
+def _emit_product(builder, values, factors):
+    return _reduce_balanced(builder.fmul, values)
+
+
+def _emit_divide(builder, values, factors):
+    return builder.fdiv(*values)
+
+
+def _get_int_exponent(value):  # Getting a small integer exponent from a constant, or None if it is not one
+    if value is not None and float(value).is_integer() and abs(float(value)) <= _INT_POWER_LIMIT:
+        return int(float(value))
+
+
+def _format_power(one, two, exponent=None):  # Powers with a small integer literal exponent are written out as products
+    exponent = _get_int_exponent(exponent)
+    if exponent is None:
+        return f'({one}**{two})'
+    product = '*'.join([one]*abs(exponent)) or '1.0'
+    return f'({product})' if exponent >= 0 else f'(1.0/({product}))'
+
+
+def _emit_power(builder, values, factors):  # Integer powers are emitted as multiplications by repeated squaring
+    base, exponent = values
+    exponent = _get_int_exponent(exponent.constant if isinstance(exponent, ir.Constant) else None)
+    if exponent is not None:
+        result = None
+        square, n = base, abs(exponent)
+        while n:
+            if n & 1:
+                result = square if result is None else builder.fmul(result, square)
+            n >>= 1
+            if n:
+                square = builder.fmul(square, square)
+        if result is None:
+            return ir.Constant(_double, 1.0)
+        return result if exponent >= 0 else builder.fdiv(ir.Constant(_double, 1.0), result)
+    pow_intrinsic = builder.module.declare_intrinsic('llvm.pow', [_double])
+    return builder.call(pow_intrinsic, values)
+
+
+def _emit_neg(builder, values, factors):
+    return builder.fneg(*values)
+
+
+_SOURCE_FORMATS = {  # Mapping each operator to the python source it lowers to
+    _sum: lambda *sources: '(' + ' + '.join(sources) + ')',
+    _product: lambda *sources: '(' + '*'.join(sources) + ')',
+    _divide: lambda one, two: f'({one}/{two})',
+    operator.pow: _format_power,  # Given the exponent literal as well, see Operation.to_source
+    operator.neg: lambda one: f'(-{one})',
+}
+
+_BINARY_OPERATORS = {  # Binary forms of the n-ary operators, for building task graphs
+    _sum: operator.add,
+    _product: operator.mul,
+}
+
+_LLVM_EMITTERS = {  # Mapping each operator to the IR it lowers to
+    _sum: _emit_sum,
+    _product: _emit_product,
+    _divide: _emit_divide,
+    operator.pow: _emit_power,
+    operator.neg: _emit_neg,
+}
+
+
+def _emit_llvm(root, builder, arguments):  # Post-order walk of the tree with an explicit stack, emitting IR per node
+    values = []
+    emitted = {}  # Shared nodes are only emitted once
+    factors = {}  # Operands of the emitted products, for fusing them into sums
+    stack = [(root, False)]
+    while stack:
+        obj, visited = stack.pop()
+        if isinstance(obj, Operation):
+            obj = obj.node
+        if isinstance(obj, Variable):
+            values.append(arguments[id(obj)])
+        elif isinstance(obj, (int, float)):
+            values.append(ir.Constant(_double, float(obj)))
+        elif id(obj) in emitted:
+            values.append(emitted[id(obj)])
+        elif visited:
+            operands = values[-len(obj.children):]
+            del values[-len(obj.children):]
+            emitted[id(obj)] = _LLVM_EMITTERS[obj.func](builder, operands, factors)
+            if obj.func is _product and len(operands) > 1:
+                factors[id(emitted[id(obj)])] = operands
+            values.append(emitted[id(obj)])
+        else:
+            stack.append((obj, True))
+            stack.extend((child, False) for child in reversed(obj.children))
+    return values.pop()
 
 
 class DelayedTaskNode:  # Class to represent tasks as nodes with children as paramters for a mathematical operation and a parent
+    __slots__ = ('func', 'name', 'parent', 'children', '_static_args', '_task', '_size', '_vars', '_compiled',
+                 '__weakref__')
+    _interned = weakref.WeakValueDictionary()  # Structurally identical nodes, shared between operations
+
+    @classmethod
+    def make(cls, func, args=None):  # Getting the shared node for func applied to args, creating it if needed
+        key = (func, tuple(map(_get_node_key, args)) if args is not None else None)
+        node = cls._interned.get(key)
+        if node is None:
+            node = cls._interned[key] = cls(func, args)
+        return node
+
     def __init__(self, func, args=None):
         self.func = func
         self.name = func.__name__
         self.parent = None
         self.children = list(args) if args is not None else None
+        self._static_args = tuple(map(_get_static_arg, args)) if args is not None else None
+        self._task = None
+        self._size = None
+        self._vars = None
+        self._compiled = {}  # Compiled functions of the tree, by backend
         self.regulate_parenting()
 
     def regulate_parenting(self):
@@ -66,43 +307,103 @@ class DelayedTaskNode:  # Class to represent tasks as nodes with children as par
             if isinstance(child, DelayedTaskNode):
                 child.parent = self
 
-    def create_task(self):
-        if self.children is not None:
-            task_args = map(_get_task, self.children)
-            task = delayed(self.func)(*task_args)
-        else:
-            task = delayed(self.func)
-        return task
-
-    def get_level_list(self):
-        level_list = [self.children]
-        while self.children is not None:
-            level_list.append(self.children)
+    def create_task(self):  # The task is built once; variables are still read when it is computed
+        if self._task is None:
+            if self._static_args is not None and self.func in _BINARY_OPERATORS and len(self._static_args) > 1:
+                # Sums and products become chains of C-level binary operators in the graph
+                task_args = map(_get_task, self._static_args)
+                self._task = reduce(delayed(_BINARY_OPERATORS[self.func]), task_args)
+            elif self._static_args is not None:
+                task_args = map(_get_task, self._static_args)
+                self._task = delayed(self.func)(*task_args)
+            else:
+                self._task = delayed(self.func)
+        return self._task
+
+    def get_variables(self):  # Variables in the tree, in order of first appearance
+        if self._vars is None:
+            self._vars = []
+            seen = set()  # Variables and shared nodes are only visited once
+            stack = [self]
+            while stack:
+                obj = stack.pop()
+                if isinstance(obj, Operation):
+                    obj = obj.node
+                if not isinstance(obj, (Variable, DelayedTaskNode)) or id(obj) in seen:
+                    continue
+                seen.add(id(obj))
+                if isinstance(obj, Variable):
+                    self._vars.append(obj)
+                else:
+                    stack.extend(reversed(obj.children))
+        return self._vars
+
+    def compile(self, cache=True):  # JIT-compiling the tree into a native function taking the variable values as arguments
+        if not cache or 'llvm' not in self._compiled:
+            variables = self.get_variables()
+            module = ir.Module(name=self.name)
+            function_type = ir.FunctionType(_double, [_double]*len(variables))
+            function = ir.Function(module, function_type, name='expr')
+            builder = ir.IRBuilder(function.append_basic_block())
+            arguments = dict(zip(map(id, variables), function.args))
+            builder.ret(_emit_llvm(self, builder, arguments))
+            ir_text = str(module)
+            if not cache:
+                return _jit_llvm(ir_text, len(variables))
+            self._compiled['llvm'] = _get_compiled(('llvm', ir_text), lambda: _jit_llvm(ir_text, len(variables)))
+        return self._compiled['llvm']
+
+    def get_level_list(self):  # Breadth-first list of the levels of the tree, operations appearing as their nodes
+        level_list = []
+        level = [self]
+        while level:
+            level_list.append(level)
+            level = [arg for obj in level if isinstance(obj, DelayedTaskNode) for arg in obj._static_args or ()]
         return level_list
 
     def vizualise(self):
         task = self.create_task()
         return task.visualize()
 
+    def get_size(self):  # Number of operations evaluated for the tree
+        if self._size is None:
+            self._size = 1 + sum(arg.get_size() for arg in self._static_args if isinstance(arg, DelayedTaskNode))
+        return self._size
+
+    def eval_direct(self, values=None, memo=None):  # Evaluating the tree by plain recursion; values maps variable ids to values
+        if memo is None:
+            memo = {}  # Results of shared nodes, so each is evaluated once
+        if id(self) not in memo:
+            args = []
+            for arg in self._static_args:
+                if isinstance(arg, DelayedTaskNode):
+                    arg = arg.eval_direct(values, memo)
+                elif isinstance(arg, Variable):
+                    arg = arg.value if values is None else values[id(arg)]
+                args.append(arg)
+            memo[id(self)] = self.func(*args)
+        return memo[id(self)]
+
     def compute(self):
+        if self.get_size() < _DIRECT_EVAL_LIMIT:
+            return self.eval_direct()
+        # Reading the variable values inline instead of running their getattr tasks
         task = self.create_task()
-        return task.compute()
-
-    def __str__(self, level=0):  # Stylish string representation of the node/tree
-        ret = "\t"*level+repr(self.name)+"\n"
-        for child in self.children:
-            if isinstance(child, Operation):
-                level = 0
-                ret += child.node.__str__(level+1)
-            elif isinstance(child, DelayedTaskNode):
-                if not (child.name in ['__neg__', 'reciprocal']):
-                    ret += child.__str__(level+1)
-                else:
-                    level += 1
-                    ret += "\t"*level+child.__repr__()+"\n"
+        graph = dict(task.__dask_graph__())
+        graph.update((variable.task.key, variable.value) for variable in self.get_variables())
+        return threaded_get(graph, task.key)
+
+    def __str__(self):  # Stylish string representation of the node/tree, one line per node indented by depth
+        lines = []
+        stack = [(self, 0)]
+        while stack:
+            obj, level = stack.pop()
+            if isinstance(obj, DelayedTaskNode):
+                lines.append('\t'*level + repr(obj.name))
+                stack.extend((arg, level+1) for arg in reversed(obj._static_args or ()))
             else:
-                ret += "\t"*(level+1)+child.__repr__()+"\n"
-        return ret
+                lines.append('\t'*level + repr(obj))
+        return '\n'.join(lines) + '\n'
 
     def __repr__(self):
         if self.children is not None:
@@ -114,23 +415,87 @@ class DelayedTaskNode:  # Class to represent tasks as nodes with children as par
 
 
 class Operation:  # Base class for all mathematical operations
-    def __init__(self, op, repr_str, latex_str, args, inverted=None):
-        self.node = DelayedTaskNode(op, args)
+    __slots__ = ('node', 'inputs', 'parent', '_repr_fn', '_latex_fn', '_repr_str', '_latex_str', 'inverted',
+                 '__weakref__')
+
+    def __init__(self, op, repr_fn, latex_fn, args, inverted=None):  # The string forms are only built when first used
+        self.node = DelayedTaskNode.make(op, args)
+        self.inputs = list(args) if args is not None else None  # Own inputs, as the shared node may hold equal ones
         if args is not None:
             for arg in args:
-                if hasattr(arg, 'node'):
+                if isinstance(arg, (Operation, Variable)):
                     arg.parent = self.node
-        self.repr_str = repr_str
-        self.latex_str = latex_str
+        self._repr_fn = repr_fn
+        self._latex_fn = latex_fn
+        self._repr_str = None
+        self._latex_str = None
         self.inverted = inverted
 
-    def compute(self):
-        return self.node.compute()
+    def to_source(self, names=None, lines=None):  # Python source for the operation, with variables named by `names`
+        if names is None:
+            names = {id(variable): variable.name for variable in self.node.get_variables()}
+        if lines is not None and id(self.node) in names:
+            return names[id(self.node)]
+        sources = [_get_source(child, names, lines) for child in self.node.children]
+        if self.node.func is operator.pow and isinstance(self.node.children[1], (int, float)):
+            sources.append(self.node.children[1])
+        source = _SOURCE_FORMATS[self.node.func](*sources)
+        if lines is None:
+            return source
+        # Assigning each shared node to a temporary once so it is only evaluated once
+        names[id(self.node)] = f'_t{len(lines)}'
+        lines.append(f'{names[id(self.node)]} = {source}')
+        return names[id(self.node)]
+
+    def compile(self, backend='numba', fastmath=True, cache=True):  # Function taking the values of node.get_variables()
+        key = (backend, fastmath)  # Cached on the node, so structurally identical operations share the code
+        if cache and key in self.node._compiled:
+            return self.node._compiled[key]
+        if backend == 'numba':
+            src = _get_lambda_source(self)
+            build = lambda: njit(fastmath=fastmath, error_model='numpy')(_lambdify(src))  # As the ufunc: 1/0 is inf
+            function = _get_compiled((backend, fastmath, src), build) if cache else build()
+        elif backend == 'vectorize':
+            src = _get_lambda_source(self)
+            signature = float64(*[float64]*len(self.node.get_variables()))
+            build = lambda: vectorize([signature], target='parallel', fastmath=fastmath)(_lambdify(src))
+            function = _get_compiled((backend, fastmath, src), build) if cache else build()
+        elif backend == 'llvm':
+            function = self.node.compile(cache=cache)
+        else:
+            raise ValueError(f'Unknown backend {backend!r}')
+        if cache:
+            self.node._compiled[key] = function
+        return function
+
+    def compute(self, *values):  # Values default to those of the variables; arrays are evaluated elementwise
+        variables = self.node.get_variables()
+        if not values:
+            values = [variable.value for variable in variables]
+        scalar = all(np.ndim(value) == 0 for value in values)
+        try:
+            # fastmath could change results for non-finite values, so it is left as an opt-in on compile()
+            function = self.compile(fastmath=False) if scalar else self.compile(backend='vectorize', fastmath=False)
+        except OverflowError:  # Literals outside the range of a double are evaluated exactly in python instead
+            return self.node.eval_direct(dict(zip(map(id, variables), values)))
+        return function(*map(float, values)) if scalar else function(*values)
+
+    @property
+    def repr_str(self):
+        if self._repr_str is None:
+            self._repr_str = self._repr_fn()
+        return self._repr_str
+
+    @property
+    def latex_str(self):
+        if self._latex_str is None:
+            self._latex_str = self._latex_fn()
+        return self._latex_str
 
     def __neg__(self):
-        repr_str = '-' + repr(self)
-        latex_str = '{-' + _get_latex_repr(self) + '}'
-        return Operation(float.__neg__, repr_str, latex_str, [self], inverted='neg')
+        repr_fn = lambda: '-' + repr(self)
+        latex_fn = lambda: '{-' + _get_latex_repr(self) + '}'
+        return Operation(neg, repr_fn, latex_fn, [self], inverted='neg')
 
     def reciprocal(self):
         return Fraction(1, self)
@@ -173,6 +538,7 @@ class Operation:  # Base class for all mathematical operations
 
 
 class Sum(Operation):
+    __slots__ = ()
     op = _sum
 
     def make_latex(input):
@@ -182,34 +548,31 @@ class Sum(Operation):
             return f' + {_get_latex_repr(input)}'
 
     def __init__(self, *inputs):
-        repr_str = ' + '.join(map(repr, inputs))
-        latex_str = '{' + _get_latex_repr(inputs[0]) + ''.join([Sum.make_latex(input) for input in inputs[1:]]) + '}'
-        super().__init__(Sum.op, repr_str, latex_str, inputs)
+        repr_fn = lambda: ' + '.join(map(repr, inputs))
+        latex_fn = lambda: '{' + _get_latex_repr(inputs[0]) + ''.join([Sum.make_latex(input) for input in inputs[1:]]) + '}'
+        super().__init__(Sum.op, repr_fn, latex_fn, inputs)
 
     def __neg__(self):
-        repr_str = '-' + repr(self)
-        latex_str = '{-(' + _get_latex_repr(self) + ')}'
-        return Operation(float.__neg__, repr_str, latex_str, [self], inverted='neg')
+        repr_fn = lambda: '-' + repr(self)
+        latex_fn = lambda: '{-(' + _get_latex_repr(self) + ')}'
+        return Operation(neg, repr_fn, latex_fn, [self], inverted='neg')
 
     def __add__(self, other):
-        added = other.node.children if isinstance(other, Sum) else [other]
-        inputs = self.node.children + added
+        added = other.inputs if isinstance(other, Sum) else [other]
+        inputs = self.inputs + added
         return Sum(*inputs)
 
     def __sub__(self, other):
-        inputs = self.node.children + [-other]
+        inputs = self.inputs + [-other]
         return Sum(*inputs)
 
 
 class Product(Operation):
+    __slots__ = ()
     op = _product
 
     def latex_check_floatable(str):
-        try:
-            float(str.strip('{()}'))
-            return True
-        except ValueError:
-            return False
+        return _float_match(str.strip('{()}')) is not None
 
     def latex_sort_key(latex):
         if Product.latex_check_floatable(latex):
@@ -232,53 +595,72 @@ class Product(Operation):
             latex_list.append(latex)
 
         # This regulates the order that a product is written in - numbers first, then fractions and finally brackets
-        sorted_latex_list = sorted(latex_list, key=Product.latex_sort_key)
-        mapping = list(map(Product.latex_sort_key, sorted_latex_list))
+        decorated = sorted([(Product.latex_sort_key(latex), latex) for latex in latex_list], key=lambda pair: pair[0])
+        mapping = [key for key, _ in decorated]
+        sorted_latex_list = [latex for _, latex in decorated]
         if mapping[0] == 0 and mapping[1] == 2:
             sorted_latex_list[1] = _turn_into_bracket(sorted_latex_list[1])
         return sorted_latex_list
 
     def __init__(self, *inputs):
-        repr_str = ' * '.join(map(repr, inputs))
-        latex_str = '{' + ''.join(Product.make_latex(inputs)) + '}'
-        super().__init__(Product.op, repr_str, latex_str, inputs)
+        repr_fn = lambda: ' * '.join(map(repr, inputs))
+        latex_fn = lambda: '{' + ''.join(Product.make_latex(inputs)) + '}'
+        super().__init__(Product.op, repr_fn, latex_fn, inputs)
 
     def __mul__(self, other):
-        added = other.node.children if isinstance(other, Product) else [other]
-        inputs = self.node.children + added
+        added = other.inputs if isinstance(other, Product) else [other]
+        inputs = self.inputs + added
         return Product(*inputs)
 
 
 class Power(Operation):
-    op = float.__pow__
+    __slots__ = ()
+    op = operator.pow
 
     def __init__(self, *inputs):
-        repr_str = '**'.join(map(repr, inputs))
-        latex_str = '{' + _turn_into_bracket(_get_latex_repr(inputs[0])) + '^{' + _get_latex_repr(inputs[1]) + '}}'
-        super().__init__(Power.op, repr_str, latex_str, inputs)
+        repr_fn = lambda: '**'.join(map(repr, inputs))
+        latex_fn = lambda: '{' + _turn_into_bracket(_get_latex_repr(inputs[0])) + '^{' + _get_latex_repr(inputs[1]) + '}}'
+        super().__init__(Power.op, repr_fn, latex_fn, inputs)
 
 
 class Fraction(Operation):
+    __slots__ = ()
     op = _divide
 
     def __init__(self, *inputs):
-        repr_str = '{}/{}'.format(*map(repr, inputs))
-        latex_str = '{\\frac{' + _get_latex_repr(inputs[0]) + '}{' + _get_latex_repr(inputs[1]) + '}}'
-        super().__init__(Fraction.op, repr_str, latex_str, inputs)
+        repr_fn = lambda: '{}/{}'.format(*map(repr, inputs))
+        latex_fn = lambda: '{\\frac{' + _get_latex_repr(inputs[0]) + '}{' + _get_latex_repr(inputs[1]) + '}}'
+        super().__init__(Fraction.op, repr_fn, latex_fn, inputs)
 
     def reciprocal(self):
-        numerator, denominator = self.node.children
+        numerator, denominator = self.inputs
         return Fraction(denominator, numerator)
 
 
 class Variable:
+    __slots__ = ('name', 'value', '_task', '_node', 'parent', '__weakref__')
+
     def __init__(self, name='x'):
         self.name = name
         self.value = None
-        self.node = DelayedTaskNode(getattr, [self, 'value'])
+        self._task = None
+        self._node = None
+        self.parent = None
+
+    @property
+    def task(self):  # Shared by every task reading this variable, only built once a task graph needs it
+        if self._task is None:
+            self._task = delayed(getattr)(self, 'value')
+        return self._task
+
+    @property
+    def node(self):
+        if self._node is None:
+            self._node = DelayedTaskNode(getattr, [self, 'value'])
+        return self._node
 
     def set_value(self, value):
-        self.value = float(value)
+        self.value = np.asarray(value, dtype=np.float64)
 
     def __str__(self):
         return self.name
@@ -290,9 +672,9 @@ class Variable:
         return f'${self.name}$'
 
     def __neg__(self):
-        repr_str = '-' + repr(self)
-        latex_str = '{' + '-' + _get_latex_repr(self) + '}'
-        return Operation(neg, repr_str, latex_str, args=[self], inverted='neg')
+        repr_fn = lambda: '-' + repr(self)
+        latex_fn = lambda: '{' + '-' + _get_latex_repr(self) + '}'
+        return Operation(neg, repr_fn, latex_fn, args=[self], inverted='neg')
 
     def reciprocal(self):
         return Fraction(1, self)
@@ -326,3 +708,29 @@ class Variable:
 
     def __rpow__(self, other):
         return Power(other, self)
+
+
+# Handlers by type for the helpers above; the object entries come last and catch operations
+_NEG_CHECKS = {
+    int: lambda child: child < 0,
+    float: lambda child: child < 0,
+    Variable: lambda child: False,
+    object: lambda child: child.inverted == 'neg',
+}
+
+_LATEX_HANDLERS = {
+    int: lambda obj: '{' + str(obj) + '}',
+    float: lambda obj: '{' + str(obj) + '}',
+    Variable: lambda obj: '{' + obj.name + '}',
+    object: lambda obj: obj.latex_str,
+}
+
+_TASK_HANDLERS = {
+    int: lambda obj: obj,
+    float: lambda obj: obj,
+    str: lambda obj: obj,
+    DelayedTaskNode: DelayedTaskNode.create_task,
+    Variable: lambda obj: obj.task,
+    Operation: lambda obj: obj.node.create_task(),
+    object: _no_task,
+}
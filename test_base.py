@@ -0,0 +1,254 @@
+import gc
+import math
+import weakref
+
+import numpy as np
+import pytest
+
+from base import Fraction, Product, Sum, Variable, _get_node_key, _get_task, _lit
+
+EXPRESSIONS = [
+    lambda x, y: x + y + 1,
+    lambda x, y: x*y - 3*x + y/2,
+    lambda x, y: (x + 1)*(x + 1) + y/(x + 1),  # shared subexpression
+    lambda x, y: (x*y + 1)/(x*y + 1) - x*y,
+    lambda x, y: x**2 + y**3 - x**5,
+    lambda x, y: x**-2 + (x + y)**-3,
+    lambda x, y: x**0 + y**16,
+    lambda x, y: x**y + x**2.5,
+    lambda x, y: -x + -(x - y),
+    lambda x, y: 2*x*y + x*y*3 + 7,  # fused into fma by the llvm backend
+]
+
+POINTS = [(2.0, 3.0), (0.5, -1.5), (1.25, 0.75)]
+
+
+def _variables(x_value, y_value):
+    x, y = Variable('x'), Variable('y')
+    x.set_value(x_value)
+    y.set_value(y_value)
+    return x, y
+
+
+def _evaluate_all(operation, values):
+    results = {
+        'numba': operation.compile('numba')(*values),
+        'numba exact': operation.compile('numba', fastmath=False)(*values),
+        'vectorize': operation.compile('vectorize')(*map(np.array, values)),
+        'llvm': operation.compile('llvm')(*values),
+        'node': operation.node.compute(),
+        'compute': operation.compute(),
+    }
+    return {backend: float(result) for backend, result in results.items()}
+
+
+@pytest.mark.parametrize('expression', EXPRESSIONS)
+@pytest.mark.parametrize('point', POINTS)
+def test_backends_agree_with_python(expression, point):
+    x, y = _variables(*point)
+    operation = expression(x, y)
+    values = [variable.value for variable in operation.node.get_variables()]
+    expected = expression(*point)
+    for backend, result in _evaluate_all(operation, values).items():
+        assert result == pytest.approx(expected, rel=1e-12), backend
+
+
+@pytest.mark.parametrize('expression', EXPRESSIONS)
+def test_array_compute_matches_scalar(expression):
+    x, y = _variables([point[0] for point in POINTS], [point[1] for point in POINTS])
+    operation = expression(x, y)
+    expected = [expression(*point) for point in POINTS]
+    np.testing.assert_allclose(operation.compute(), expected, rtol=1e-12)
+    np.testing.assert_allclose(operation.node.compute(), expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize('x_value', [math.inf, -math.inf, math.nan])
+def test_non_finite_inputs(x_value):
+    x, y = _variables(x_value, 2.0)
+    for expression in [lambda x, y: x - x, lambda x, y: (x + 1)/(x + 1), lambda x, y: x*y + 1]:
+        operation = expression(x, y)
+        expected = expression(x_value, 2.0)
+        values = [float(variable.value) for variable in operation.node.get_variables()]
+        for result in [operation.compute(), operation.node.compute(), operation.compile('llvm')(*values),
+                       operation.compile('numba', fastmath=False)(*values)]:
+            assert float(result) == pytest.approx(expected, nan_ok=True)
+
+
+def test_non_finite_and_huge_literals():
+    x, _ = _variables(2.0, 0.0)
+    assert (x + math.inf).compute() == math.inf
+    assert (x - math.inf).compute() == -math.inf
+    assert math.isnan((x*math.nan).compute())
+    assert (Fraction(2**1100, 2**1090)*x).compute() == 2048.0
+
+
+def test_compiled_function_outlives_operation():
+    x, y = Variable('x'), Variable('y')
+    llvm_function = (x*y + 1).compile('llvm')
+    numba_function = (x*y + 2).compile('numba')
+    for k in range(2, 8):
+        (x*k + y*k - k).compile('llvm')
+    gc.collect()
+    assert llvm_function(2.0, 3.0) == 7.0
+    assert numba_function(2.0, 3.0) == 8.0
+
+
+def test_shared_nodes_reuse_compiled_function():
+    x, _ = _variables(2.0, 0.0)
+    function = (x*3 + 1).compile()
+    assert (x*3 + 1).compile() is function
+    assert (x*3 + 1).compute() == 7.0
+
+
+def test_single_operand_product_in_sum():
+    x, _ = _variables(2.0, 0.0)
+    assert Sum(Product(x), 1).compile('llvm')(2.0) == 3.0
+
+
+def test_repr_does_not_depend_on_earlier_expressions():
+    x = Variable('x')
+    Fraction(1.0, x)
+    assert repr(x.reciprocal().reciprocal()) == 'x/1'
+    Sum(x, 1.0)
+    assert repr(Sum(x, 1) + x) == 'x + 1 + x'
+
+
+def test_get_task_rejects_unknown_objects():
+    x, _ = _variables(2.0, 0.0)
+    assert _get_task(x + 1).compute() == 3.0
+    with pytest.raises(TypeError):
+        _get_task([x])
+
+
+def test_deep_shared_subexpressions():
+    x, _ = _variables(0.3, 0.0)
+    operation, expected = x + 1, 0.3 + 1
+    for _ in range(22):  # The tree has millions of paths but only a few dozen distinct nodes
+        operation = operation*operation*0.5 + 0.25
+        expected = expected*expected*0.5 + 0.25
+    assert operation.node.get_variables() == [x]
+    assert operation.node.eval_direct() == pytest.approx(expected)
+    assert operation.compute() == pytest.approx(expected)
+    assert operation.compile('llvm')(0.3) == pytest.approx(expected)
+
+
+def test_common_constants_share_keys_except_negative_zero():
+    assert _lit(1) == _lit(1.0) == _lit(np.float64(1.0))
+    assert _lit(0) == _lit(0.0)
+    assert _lit(-0.0) is None
+
+
+def test_signed_zero_literals_are_not_shared():
+    x = Variable('x')
+    assert _get_node_key(0.0) != _get_node_key(-0.0)
+    assert (x*0.0).node is not (x*-0.0).node
+    (1/(x*0.0)).compile('llvm')
+    assert (1/(x*-0.0)).compile('llvm')(1.0) == -math.inf
+
+
+def test_compiled_cache_does_not_keep_values_alive():
+    x = Variable('x')
+    x.set_value(np.zeros(1000))
+    value = weakref.ref(x.value)
+    operation = x*2 + 1
+    operation.compute()
+    operation.compile('llvm')
+    del x, operation
+    gc.collect()
+    assert value() is None
+
+
+@pytest.mark.parametrize('backend', ['numba', 'vectorize', 'llvm'])
+def test_compile_without_cache(backend):
+    x = Variable('x')
+    operation = x*5 + 3
+    function = operation.compile(backend, cache=False)
+    assert operation.compile(backend, cache=False) is not function
+    assert operation.compile(backend) is not function
+    assert float(function(2.0)) == 13.0
+
+
+def test_zero_division_matches_across_paths():
+    x, _ = _variables(0.0, 0.0)
+    operation = 1/x
+    assert operation.compute(0.0) == math.inf
+    assert operation.compute() == math.inf
+    np.testing.assert_array_equal(operation.compute(np.array([0.0, -0.0])), [math.inf, -math.inf])
+    assert operation.compile('llvm')(0.0) == math.inf
+    with np.errstate(divide='ignore'):
+        assert operation.node.compute() == math.inf
+
+
+def test_integer_powers_are_lowered_from_the_literal_exponent():
+    x, n = Variable('x'), Variable('3')
+    assert (x**3).to_source() == '(x*x*x)'
+    assert (x**-2).to_source() == '(1.0/(x*x))'
+    assert (x**n).to_source() == '(x**3)'
+    assert (x**2.5).to_source() == '(x**2.5)'
+
+
+@pytest.mark.parametrize('exponent', [-2, -3, -2.5])
+def test_negative_powers_of_zero(exponent):
+    x, _ = _variables(0.0, 0.0)
+    operation = x**exponent
+    assert operation.compute(0.0) == math.inf
+    assert operation.compute() == math.inf
+    assert operation.compile('llvm')(0.0) == math.inf
+
+
+def test_large_trees_are_computed_with_dask():
+    x, y = _variables(0.5, 2.0)
+
+    def expression(x, y):
+        result = x
+        for k in range(1, 12):
+            result = (result*y*0.5 + x + k)/(y + k) - x**2
+        return result
+
+    operation = expression(x, y)
+    assert operation.node.get_size() >= 32
+    assert operation.node.compute() == pytest.approx(expression(0.5, 2.0), rel=1e-12)
+    x.set_value(1.5)  # The values are read at compute time, not when the graph is built
+    assert operation.node.compute() == pytest.approx(expression(1.5, 2.0), rel=1e-12)
+    x.set_value([0.5, 1.5, -3.0])
+    np.testing.assert_allclose(operation.node.compute(), [expression(value, 2.0) for value in [0.5, 1.5, -3.0]],
+                               rtol=1e-12)
+
+
+def test_strings_are_built_lazily():
+    x = Variable('x')
+    operation = Sum(x, 1)*x
+    assert operation._repr_str is None and operation._latex_str is None
+    assert repr(operation) == 'x + 1 * x'
+    assert operation._latex_str is None
+    assert operation.latex_str == '{{x}{({x} + {1})}}'
+
+
+def test_product_latex_order():
+    x, y = Variable('x'), Variable('y')
+    assert Product(x + 1, Fraction(1, y), x, 2.5, -y).latex_str == '{{2.5}{-{y}}{\\frac{{1}}{{y}}}{x}{({x} + {1})}}'
+    assert Product(2, Fraction(1, y)).latex_str == '{{2}{(\\frac{{1}}{{y}})}}'
+    assert Product(x, 1e-3, math.inf).latex_str == '{{0.001}{inf}{x}}'
+
+
+def test_get_level_list():
+    x = Variable('x')
+    node = (x*2 + 1).node
+    levels = node.get_level_list()
+    assert [len(level) for level in levels] == [1, 2, 2]
+    assert levels[0] == [node]
+    assert levels[2] == [x, 2]
+
+
+def test_node_str_indents_by_depth():
+    x = Variable('x')
+    assert str((x*2 + 1).node) == "'_sum'\n\t'_product'\n\t\tx\n\t\t2\n\t1\n"
+
+
+def test_operations_and_variables_are_weakly_referenceable():
+    x = Variable('x')
+    operation = x + 1
+    references = [weakref.ref(x), weakref.ref(operation)]
+    del x, operation
+    gc.collect()
+    assert [reference() for reference in references] == [None, None]